@@ -1,153 +1,262 @@
-import csv
 import json
+import mmap
 import os
-import requests
-from bs4 import BeautifulSoup
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import time
-import random
+import aiohttp
+import asyncio
+from lxml import html as lxml_html
 import re
+import sqlite3
+import time
+from aiolimiter import AsyncLimiter
+from contextlib import closing
+from itertools import islice
+from shorten_definitions import shorten_or_keep
+
+# orjson encodes in C and writes UTF-8 directly; fall back to json if missing
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# uvloop's libuv-based event loop schedules coroutines faster than the
+# default asyncio loop; it is not available on Windows
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
 
 # Paths
 csv_path = os.path.join(os.path.dirname(__file__), '../temp_dict_repo/nouns.csv')
 json_output_path = os.path.join(os.path.dirname(__file__), '../data/common_words.json')
+cache_path = os.path.join(os.path.dirname(__file__), '.wiktionary_cache.sqlite')
 
-def fetch_definition(word):
-    url = f"https://ru.wiktionary.org/wiki/{word}"
-    try:
-        # Add a small random delay to be polite
-        time.sleep(random.uniform(0.1, 0.5))
-        
-        response = requests.get(url, headers={'User-Agent': 'Mozilla/5.0 (compatible; CrosswordBot/1.0)'}, timeout=10)
-        if response.status_code != 200:
-            return None
-            
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # Find the "Значение" (Meaning) header
-        # It could be a span with id="Значение" inside an h3/h4, or the header itself
-        meaning_node = soup.find(id='Значение')
-        if not meaning_node:
-            # Try finding by text if id is missing
-            for header in soup.find_all(['h3', 'h4', 'h2']):
-                if 'Значение' in header.get_text():
-                    meaning_node = header
-                    break
-        
-        if not meaning_node:
-            # print(f"Debug: 'Значение' header not found for {word}")
-            return None
-            
-        # If we found the span, the header is the parent
-        if meaning_node.name == 'span':
-            header = meaning_node.parent
-        else:
-            header = meaning_node
-            
-        # Helper to find ol in siblings
-        def find_ol_in_siblings(start_node):
-            current = start_node.next_sibling
-            siblings_count = 0
-            while current:
-                if isinstance(current, str) and not current.strip():
-                    current = current.next_sibling
+# Cached pages younger than this are reused without touching the network
+CACHE_MAX_AGE = 30 * 24 * 60 * 60
+
+# Polite cap on outbound requests, shared by every in-flight fetch
+MAX_REQUESTS_PER_SECOND = 20
+
+# Transient failures are retried with exponential backoff (0.5s, 1s, 2s)
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 0.5
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Cleanup patterns, compiled once rather than on every definition
+_BRACKET = re.compile(r'\[.*?\]')
+_WS = re.compile(r'\s+')
+
+def dumps(obj):
+    # Serialize to compact UTF-8 bytes with non-ASCII characters left unescaped
+    if orjson:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def open_cache():
+    conn = sqlite3.connect(cache_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS pages ("
+        "url TEXT PRIMARY KEY, body BLOB, definition TEXT, fetched_at REAL, "
+        "etag TEXT, last_modified TEXT)"
+    )
+    # Caches written before validators were stored lack the last two columns
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(pages)")}
+    for column in ('etag', 'last_modified'):
+        if column not in columns:
+            conn.execute(f"ALTER TABLE pages ADD COLUMN {column} TEXT")
+    return conn
+
+async def get_with_retries(session, limiter, url, headers=None):
+    for attempt in range(MAX_RETRIES + 1):
+        if attempt:
+            await asyncio.sleep(BACKOFF_FACTOR * 2 ** (attempt - 1))
+        try:
+            async with limiter, session.get(url, headers=headers) as response:
+                if response.status in RETRY_STATUSES and attempt < MAX_RETRIES:
                     continue
-                
-                if current.name == 'ol':
-                    return current
-                
-                if current.name in ['h3', 'h4', 'h2']:
-                    # Reached next section
-                    return None
-                
-                current = current.next_sibling
-                siblings_count += 1
-                if siblings_count > 50: 
-                    break
+                return response.status, response.headers, await response.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            if attempt == MAX_RETRIES:
+                raise
+
+async def fetch_definition(session, sem, limiter, cache, word):
+    url = f"https://ru.wiktionary.org/wiki/{word}"
+
+    # Serve recent pages from the cache, skipping both the request and the parse
+    row = cache.execute(
+        "SELECT definition, fetched_at, etag, last_modified FROM pages WHERE url = ?", (url,)
+    ).fetchone()
+    if row and time.time() - row[1] < CACHE_MAX_AGE:
+        return row[0]
+
+    # Older pages are revalidated, so an unchanged page costs only a bodiless 304
+    headers = {}
+    if row and row[2]:
+        headers['If-None-Match'] = row[2]
+    if row and row[3]:
+        headers['If-Modified-Since'] = row[3]
+
+    async with sem:
+        try:
+            status, response_headers, content = await get_with_retries(session, limiter, url, headers)
+        except Exception as e:
+            print(f"Error fetching {word}: {e}")
             return None
 
-        ol_node = find_ol_in_siblings(header)
-        
-        # If not found and header is in a div, try siblings of the div
-        if not ol_node and header.parent.name == 'div':
-             ol_node = find_ol_in_siblings(header.parent)
-
-        definition = None
-        if ol_node:
-            first_li = ol_node.find('li')
-            if first_li:
-                definition = first_li.get_text(" ", strip=True)
-                # Clean up: remove [1], (citation), etc if possible.
-                # Remove square brackets and their content
-                definition = re.sub(r'\[.*?\]', '', definition)
-                # Remove "◆" and everything after it (examples)
-                if '◆' in definition:
-                    definition = definition.split('◆')[0]
-                # Remove extra spaces
-                definition = re.sub(r'\s+', ' ', definition).strip()
-        
-        return definition
+    if status == 304 and row:
+        with cache:
+            cache.execute("UPDATE pages SET fetched_at = ? WHERE url = ?", (time.time(), url))
+        return row[0]
+    if status != 200:
+        return None
 
+    try:
+        definition = parse_definition(content)
     except Exception as e:
-        print(f"Error fetching {word}: {e}")
+        print(f"Error parsing {word}: {e}")
         return None
 
+    with cache:
+        cache.execute(
+            "INSERT OR REPLACE INTO pages (url, body, definition, fetched_at, etag, last_modified) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (url, content, definition, time.time(),
+             response_headers.get('ETag'), response_headers.get('Last-Modified'))
+        )
+    return definition
+
+def parse_definition(content):
+    # lxml parses in C and does its own encoding detection on the raw bytes
+    doc = lxml_html.fromstring(content)
+
+    # Find the "Значение" (Meaning) header
+    # It could be a span with id="Значение" inside an h3/h4, or the header itself
+    nodes = doc.xpath('//*[@id="Значение"]')
+    if not nodes:
+        # Try finding by text if id is missing
+        nodes = doc.xpath('//*[self::h3 or self::h4 or self::h2][contains(string(.), "Значение")]')
+
+    if not nodes:
+        # print(f"Debug: 'Значение' header not found for {word}")
+        return None
+
+    # If we found the span, the header is the parent
+    header = nodes[0]
+    if header.tag == 'span':
+        header = header.getparent()
+
+    # The first <ol> among the next siblings, unless another section header comes first
+    def find_ol_in_siblings(start_node):
+        found = start_node.xpath(
+            'following-sibling::*[position() <= 50]'
+            '[self::ol or self::h2 or self::h3 or self::h4][1][self::ol]'
+        )
+        return found[0] if found else None
+
+    ol_node = find_ol_in_siblings(header)
+
+    # If not found and header is in a div, try siblings of the div
+    parent = header.getparent()
+    if ol_node is None and parent is not None and parent.tag == 'div':
+        ol_node = find_ol_in_siblings(parent)
+
+    definition = None
+    if ol_node is not None:
+        first_li = ol_node.find('.//li')
+        if first_li is not None:
+            definition = " ".join(t.strip() for t in first_li.xpath('.//text()') if t.strip())
+            # Clean up: remove [1], (citation), etc if possible.
+            # Remove square brackets and their content
+            definition = _BRACKET.sub('', definition)
+            # Remove "◆" and everything after it (examples)
+            if '◆' in definition:
+                definition = definition.split('◆')[0]
+            # Remove extra spaces
+            definition = _WS.sub(' ', definition).strip()
+
+    return definition
+
+def ndjson_to_json_array(ndjson_path, json_path):
+    # Each line is already a compact JSON object, so the array is built by
+    # joining the lines with commas without decoding them again
+    with open(ndjson_path, 'rb') as src, open(json_path, 'wb') as dst:
+        dst.write(b'[')
+        for i, line in enumerate(src):
+            if i:
+                dst.write(b',')
+            dst.write(line.rstrip(b'\n'))
+        dst.write(b']')
+
 def process_words():
-    words_to_fetch = []
-    
     # Read CSV
     try:
-        with open(csv_path, 'r', encoding='utf-8') as f:
-            reader = csv.reader(f, delimiter='\t')
-            header = next(reader)
-            
-            count = 0
-            for row in reader:
-                if count >= 1000: # Limit to 1000
-                    break
-                if len(row) < 1:
-                    continue
-                
-                word = row[0].strip()
-                words_to_fetch.append(word)
-                count += 1
+        # Only the first column is needed, so read raw lines from a memory map
+        # and cut at the first tab instead of tokenizing every field with csv
+        with open(csv_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            header = mm.readline()
+            lines = (line.rstrip(b'\r\n') for line in iter(mm.readline, b''))
+
+            # Limit to 1000, skipping empty rows
+            words_to_fetch = [
+                line.split(b'\t', 1)[0].decode('utf-8').strip()
+                for line in islice(filter(None, lines), 1000)
+            ]
     except Exception as e:
         print(f"Error reading CSV: {e}")
         return
 
     print(f"Found {len(words_to_fetch)} words. Starting fetch...")
     
-    results = []
-    
-    # Use ThreadPoolExecutor
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        future_to_word = {executor.submit(fetch_definition, word): word for word in words_to_fetch}
-        
-        completed = 0
-        for future in as_completed(future_to_word):
-            word = future_to_word[future]
-            try:
-                definition = future.result()
-                if definition:
-                    results.append({
-                        "word": word,
-                        "definition": definition
-                    })
-                else:
-                    # print(f"No definition found for {word}")
-                    pass
-            except Exception as exc:
-                print(f"{word} generated an exception: {exc}")
-            
-            completed += 1
-            if completed % 50 == 0:
-                print(f"Progress: {completed}/{len(words_to_fetch)}")
+    async def main(out):
+        # One session and connection pool shared by all requests, so TLS
+        # connections to the same host are reused instead of re-established
+        sem = asyncio.Semaphore(50)
+        limiter = AsyncLimiter(MAX_REQUESTS_PER_SECOND, 1)
+        connector = aiohttp.TCPConnector(limit=100, limit_per_host=50, keepalive_timeout=30)
+        saved = 0
+        with closing(open_cache()) as cache:
+            async with aiohttp.ClientSession(
+                connector=connector,
+                headers={'User-Agent': 'Mozilla/5.0 (compatible; CrosswordBot/1.0)'},
+                timeout=aiohttp.ClientTimeout(total=10)
+            ) as session:
+
+                async def fetch_with_word(word):
+                    try:
+                        return word, await fetch_definition(session, sem, limiter, cache, word)
+                    except Exception as exc:
+                        print(f"{word} generated an exception: {exc}")
+                        return word, None
+
+                tasks = [fetch_with_word(word) for word in words_to_fetch]
+                for completed, next_result in enumerate(asyncio.as_completed(tasks), 1):
+                    word, definition = await next_result
+                    if definition:
+                        # Write each entry as soon as it arrives so an interrupted
+                        # run keeps everything fetched so far. Definitions are
+                        # shortened here, so no separate shortening pass is needed
+                        entry = {"word": word, "definition": shorten_or_keep(definition)}
+                        out.write(dumps(entry) + b'\n')
+                        out.flush()
+                        saved += 1
+                    else:
+                        # print(f"No definition found for {word}")
+                        pass
+
+                    if completed % 50 == 0:
+                        print(f"Progress: {completed}/{len(words_to_fetch)}")
+        return saved
+
+    ndjson_path = json_output_path + '.ndjson'
+    with open(ndjson_path, 'wb') as out:
+        run = uvloop.run if uvloop else asyncio.run
+        saved = run(main(out))
 
     # Save to JSON
     try:
-        with open(json_output_path, 'w', encoding='utf-8') as f:
-            json.dump(results, f, ensure_ascii=False, indent=2)
-        print(f"Successfully saved {len(results)} words to {json_output_path}")
+        ndjson_to_json_array(ndjson_path, json_output_path)
+        os.remove(ndjson_path)
+        print(f"Successfully saved {saved} words to {json_output_path}")
     except Exception as e:
         print(f"Error saving JSON: {e}")
 
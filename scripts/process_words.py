@@ -1,45 +1,50 @@
-import csv
 import json
+import mmap
 import os
+from dataclasses import asdict, dataclass
+from itertools import islice
+from shorten_definitions import shorten_or_keep
+
+# Prefer orjson when installed; the standard json module works the same, only slower
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Paths
 csv_path = os.path.join(os.path.dirname(__file__), '../temp_dict_repo/nouns.csv')
 json_output_path = os.path.join(os.path.dirname(__file__), '../data/common_words.json')
 
+@dataclass(slots=True, frozen=True)
+class Entry:
+    # A slotted record is much smaller than a two-key dict per word
+    word: str
+    definition: str
+
 def process_words():
-    words_list = []
-    
     try:
-        with open(csv_path, 'r', encoding='utf-8') as f:
-            # It's a TSV file
-            reader = csv.reader(f, delimiter='\t')
-            header = next(reader) # Skip header
-            
-            count = 0
-            for row in reader:
-                if count >= 1000:
-                    break
-                
-                if len(row) < 3:
-                    continue
-                    
-                word = row[0].strip()
-                # The translation column is index 2
-                translation = row[2].strip()
-                
-                # Basic cleaning of the translation to make it a good clue
-                # If there are multiple meanings separated by semicolon, maybe just take the first few?
-                # For now, let's keep it as is, it usually provides good context.
-                
-                words_list.append({
-                    "word": word,
-                    "definition": translation
-                })
-                count += 1
+        with open(csv_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # It's a TSV file; splitting raw lines on tabs is much cheaper
+            # than going through csv, and only the first three fields matter
+            header = mm.readline() # Skip header
+            rows = (line.rstrip(b'\r\n').split(b'\t', 3) for line in iter(mm.readline, b''))
+
+            # The translation column is index 2; the 1000 limit counts only
+            # rows that have one
+            # Translations are shortened into clues here, so the file is written once
+            rows = (row for row in rows if len(row) >= 3)
+            words_list = [
+                Entry(row[0].decode('utf-8').strip(), shorten_or_keep(row[2].decode('utf-8').strip()))
+                for row in islice(rows, 1000)
+            ]
                 
-        # Write to JSON
-        with open(json_output_path, 'w', encoding='utf-8') as f:
-            json.dump(words_list, f, ensure_ascii=False, indent=2)
+        # Write to JSON (orjson serializes dataclasses natively)
+        if orjson:
+            with open(json_output_path, 'wb') as f:
+                f.write(orjson.dumps(words_list))
+        else:
+            with open(json_output_path, 'w', encoding='utf-8') as f:
+                json.dump(words_list, f, ensure_ascii=False, separators=(',', ':'), default=asdict)
             
         print(f"Successfully processed {len(words_list)} words and saved to {json_output_path}")
 
@@ -1,24 +1,39 @@
 import json
 import os
 import re
+from concurrent.futures import ProcessPoolExecutor
+
+# Prefer orjson when installed; the standard json module works the same, only slower
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Paths
 json_path = os.path.join(os.path.dirname(__file__), '../data/common_words.json')
 
+# Files with more entries than this are shortened in a process pool
+PARALLEL_THRESHOLD = 5000
+
+# Parenthesised and bracketed asides, matched in a single scan of the string
+_CLEAN = re.compile(r'\([^)]*\)|\[[^\]]*\]')
+
 def shorten_definition(definition):
     if not definition:
         return definition
+
+    # Fast path: nothing to strip or cut and already short enough
+    if ('(' not in definition and '[' not in definition and ';' not in definition
+            and '. ' not in definition and len(definition.split()) <= 10):
+        return definition.strip()
         
     # 1. Remove content in parentheses
     # Handle nested parentheses? Simple regex handles non-nested.
-    cleaned = re.sub(r'\([^)]*\)', '', definition)
-    
     # 2. Remove content in square brackets (just in case)
-    cleaned = re.sub(r'\[[^\]]*\]', '', cleaned)
+    cleaned = _CLEAN.sub('', definition)
     
     # 3. Split by semicolon and take the first part
-    if ';' in cleaned:
-        cleaned = cleaned.split(';')[0]
+    cleaned = cleaned.partition(';')[0]
         
     # 4. Split by period (end of sentence) if it looks like a sentence end
     # Be careful with abbreviations like "см." or "анат."
@@ -29,11 +44,10 @@ def shorten_definition(definition):
         # For now, let's just take the first part if it's long enough?
         # Actually, many definitions start with "анат. орган...", we don't want to cut at "анат."
         # So maybe only split if the part before is > 3 chars?
-        parts = cleaned.split('. ')
-        if len(parts) > 1:
-             # If the first part is very short (likely abbreviation), keep going
-             if len(parts[0]) > 4: 
-                 cleaned = parts[0]
+        first = cleaned.partition('. ')[0]
+        # If the first part is very short (likely abbreviation), keep going
+        if len(first) > 4:
+            cleaned = first
     
     cleaned = cleaned.strip()
     
@@ -44,17 +58,15 @@ def shorten_definition(definition):
         
     # 6. If still too long, try splitting by comma
     if ',' in cleaned:
-        parts = cleaned.split(',')
         # Take parts until we have enough, or just the first one
         # Usually the first part before a comma is the main definition
-        candidate = parts[0].strip()
+        candidate = cleaned.partition(',')[0].strip()
         if len(candidate.split()) <= 10:
             return candidate
             
     # 7. Try splitting by " или " (or)
     if ' или ' in cleaned:
-        parts = cleaned.split(' или ')
-        candidate = parts[0].strip()
+        candidate = cleaned.partition(' или ')[0].strip()
         if len(candidate.split()) <= 10:
             return candidate
 
@@ -64,24 +76,42 @@ def shorten_definition(definition):
     truncated = ' '.join(words[:10])
     return truncated # + "..." # Optional ellipsis
 
+def shorten_or_keep(definition):
+    # Fall back to the original text rather than end up with an empty clue
+    return shorten_definition(definition) or definition
+
 def process_file():
     try:
-        with open(json_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        if orjson:
+            with open(json_path, 'rb') as f:
+                data = orjson.loads(f.read())
+        else:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
             
+        originals = [entry.get('definition', '') for entry in data]
+        if len(data) > PARALLEL_THRESHOLD:
+            # Spread large files across cores; below the threshold the
+            # worker start-up costs more than it saves
+            with ProcessPoolExecutor() as executor:
+                shortened_list = list(executor.map(shorten_definition, originals, chunksize=256))
+        else:
+            shortened_list = map(shorten_definition, originals)
+
         processed_count = 0
-        for entry in data:
-            original = entry.get('definition', '')
-            shortened = shorten_definition(original)
-            
+        for entry, shortened in zip(data, shortened_list):
             # Ensure we don't end up with empty definitions
             if shortened and len(shortened.strip()) > 0:
                 entry['definition'] = shortened
             
             processed_count += 1
             
-        with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        if orjson:
+            with open(json_path, 'wb') as f:
+                f.write(orjson.dumps(data))
+        else:
+            with open(json_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
             
         print(f"Successfully processed {processed_count} definitions.")
         